@@ -1,34 +1,70 @@
 # real_process_test_with_cleanup.py
 import os
 import time
-import json
+import shutil
+import random
+import hashlib
 import logging
+import logging.handlers
+import queue
+import threading
+import orjson
 import requests
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import date, datetime
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.filepost import encode_multipart_formdata
+from urllib3.util.retry import Retry
 
 # 加载环境变量
 load_dotenv()
 
-# 配置日志
+# 配置日志（文件日志经内存缓冲批量写入，遇到ERROR或缓冲满时立即落盘）
+# 文件日志记录DEBUG级别的完整过程，控制台级别由 LOG_LEVEL 控制（默认INFO）
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_log_file_target = logging.FileHandler("real_process_test.log")
+_log_file_target.setFormatter(logging.Formatter(LOG_FORMAT))
+_log_buffer_handler = logging.handlers.MemoryHandler(
+    capacity=256,
+    flushLevel=logging.ERROR,
+    target=_log_file_target
+)
+_log_buffer_handler.setLevel(logging.DEBUG)
+# LOG_LEVEL 取值非法时回退到 INFO，避免导入阶段直接报错退出
+_log_stream_level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").strip().upper())
+if not isinstance(_log_stream_level, int):
+    _log_stream_level = logging.INFO
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setLevel(_log_stream_level)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler("real_process_test.log"),
-        logging.StreamHandler()
+        _log_buffer_handler,
+        _log_stream_handler
     ]
 )
 logger = logging.getLogger(__name__)
-
-# 读取固定配置
-YS_ACCESS_TOKEN = os.getenv("YS_ACCESS_TOKEN")
-DEVICE_SERIAL = os.getenv("DEVICE_SERIAL")
-CHANNEL_NO = int(os.getenv("CAPTURE_CHANNEL_NO", "1"))
-PROJECT_ID = os.getenv("CAPTURE_PROJECT_ID")
-VOICE_FILE_PATH = os.getenv("VOICE_FILE_PATH")
-# 新增配置：是否启用云端图片清理
-ENABLE_CLOUD_CLEANUP = os.getenv("ENABLE_CLOUD_CLEANUP", "1").lower() in ("1", "true", "yes")
+logger.setLevel(logging.DEBUG)
+
+# 是否启用识别结果缓存（按图片内容哈希，命中时跳过AI识别）
+# 注意：只有字节完全相同的图片才会命中。萤石抓拍图带OSD时间水印，连续抓拍几乎不会相同，
+# 启用后每次抓拍都要在识别前先下载图片，仅适用于无水印等画面逐字节一致的场景
+ENABLE_DETECT_CACHE = os.getenv("ENABLE_DETECT_CACHE", "0").lower() in ("1", "true", "yes")
+DETECT_CACHE_TTL = int(os.getenv("DETECT_CACHE_TTL", "3600"))
+DETECT_CACHE_FILE = os.getenv("DETECT_CACHE_FILE", "./detect_cache.json")
+DETECT_CACHE_MAX_SIZE = 256
+# 是否只在本地保存告警图片（非告警图片不下载、不写识别结果）
+SAVE_ALERT_ONLY = os.getenv("SAVE_ALERT_ONLY", "1").lower() in ("1", "true", "yes")
+# 多设备批量执行：DEVICE_CHANNELS 形如 "序列号:通道号,序列号:通道号"，未配置时只执行单设备
+DEVICE_CHANNELS = os.getenv("DEVICE_CHANNELS", "")
+BATCH_MAX_CONCURRENT = int(os.getenv("BATCH_MAX_CONCURRENT", "10"))
+BATCH_MAX_PER_SECOND = float(os.getenv("BATCH_MAX_PER_SECOND", "5"))
+# 识别结果JSON是否格式化输出（调试用，默认紧凑格式）
+RESULT_JSON_PRETTY = os.getenv("RESULT_JSON_PRETTY", "0").lower() in ("1", "true", "yes")
 
 # 接口URL
 CAPTURE_URL = "https://open.ys7.com/api/open/cloud/v1/capture/save"
@@ -38,13 +74,241 @@ VOICE_SENDONCE_URL = "https://open.ys7.com/api/lapp/voice/sendonce"
 # 新增删除文件接口URL
 DELETE_FILE_URL = "https://open.ys7.com/api/open/cloud/v1/file"
 
+# 安全帽识别请求体模板，仅图片URL随每次抓拍变化，调用时替换占位符
+# stream 必须为 False：该类算法接口在 stream=True 时只创建异步任务，
+# 识别结果通过云信令推送（见台球视频分析），不会以分块形式随响应返回
+DETECT_URL_PLACEHOLDER = b'"__URL__"'
+DETECT_BODY_TEMPLATE = orjson.dumps({
+    "stream": False,
+    "dataInfo": [{"data": "__URL__", "type": "url", "modal": "image"}],
+    "dataParams": [{"modal": "image", "img_width": 1280, "img_height": 720}]
+})
+
+USER_AGENT = "SafetyHelmetMonitor/1.0"
+JSON_HEADERS = {"Content-Type": "application/json"}
+# 请求超时 (连接超时, 读取超时)：连接阶段快速失败，读取阶段保留接口处理时间
+HTTP_CONNECT_TIMEOUT = 5
+CAPTURE_TIMEOUT = (HTTP_CONNECT_TIMEOUT, 30)
+DETECT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, 20)
+DOWNLOAD_TIMEOUT = (HTTP_CONNECT_TIMEOUT, 30)
+VOICE_TIMEOUT = (HTTP_CONNECT_TIMEOUT, 15)
+DELETE_TIMEOUT = (HTTP_CONNECT_TIMEOUT, 10)
+# 识别完成后并行执行的任务数（下载保存→云端清理、语音告警）
+POST_DETECTION_WORKERS = 2
+# 图片下载分块大小（流式写盘）
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 语音下发重试配置：仅对暂时性错误码做指数退避重试
+VOICE_MAX_RETRIES = 3
+VOICE_RETRY_BASE_DELAY = 1.0
+VOICE_RETRY_MAX_DELAY = 30.0
+VOICE_RETRY_JITTER = 0.5
+# 仅指服务端响应中返回的错误码；本地请求超时使用 49998，不在此列
+VOICE_RETRYABLE_CODES = ("20008",)
+# POST 请求仅在以下状态码（服务端明确未处理）时由传输层重试
+POST_RETRY_STATUSES = (429, 503)
+# 语音下发错误码说明
+VOICE_ERROR_MAP = {
+    "10001": "参数不合法",
+    "20002": "设备不存在",
+    "10031": "权限不足",
+    "20018": "用户不拥有该设备",
+    "20007": "设备不在线",
+    "20008": "设备响应超时",
+    "20001": "通道不存在",
+    "20015": "设备不支持对讲",
+    "111000": "资源包余量不足",
+}
+
+
+class ApiRetry(Retry):
+    """
+    传输层重试策略
+    - 连接失败：所有请求均重试（请求尚未发出）
+    - GET/DELETE：幂等，读超时和 429/5xx 均重试
+    - POST（抓拍、识别、语音下发）：非幂等，仅在服务端明确未处理（429/503）时重试，
+      读超时不重试，避免重复抓拍或重复播报
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST":
+            return bool(self.total) and status_code in POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def create_http_session(pool_maxsize: int = 8) -> requests.Session:
+    """创建共享HTTP会话 - 复用连接池，避免每次请求重新建立TCP/TLS连接"""
+    session = requests.Session()
+    retry = ApiRetry(
+        total=3,
+        backoff_factor=1.0,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "DELETE"]),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+@dataclass(frozen=True)
+class Config:
+    """设备与账号配置 - 启动时从环境变量一次性读取并校验"""
+    access_token: str
+    device_serial: str
+    channel_no: int
+    project_id: str
+    voice_path: str
+    # 是否启用云端图片清理
+    cleanup_enabled: bool
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        """从环境变量构建配置，缺少必要配置时抛出 ValueError"""
+        env = {name: os.getenv(name) for name in ("YS_ACCESS_TOKEN", "DEVICE_SERIAL", "CAPTURE_PROJECT_ID")}
+        missing = [name for name, value in env.items() if not value]
+        if missing:
+            raise ValueError(f"缺少必要配置: {', '.join(missing)}")
+
+        return cls(
+            access_token=env["YS_ACCESS_TOKEN"],
+            device_serial=env["DEVICE_SERIAL"],
+            channel_no=int(os.getenv("CAPTURE_CHANNEL_NO", "1")),
+            project_id=env["CAPTURE_PROJECT_ID"],
+            voice_path=os.getenv("VOICE_FILE_PATH"),
+            cleanup_enabled=os.getenv("ENABLE_CLOUD_CLEANUP", "1").lower() in ("1", "true", "yes")
+        )
+
+
+# 控制台输出锁：多设备并发时横幅和总结整块输出，避免交错
+_print_lock = threading.Lock()
+
+# 后台写盘队列：识别结果JSON不在主流程中同步落盘
+_writer_q = queue.Queue()
+
+
+def _drain_writes():
+    """后台线程 - 依次写入队列中的 (路径, 字节内容, 失败回调)"""
+    while True:
+        path, data, on_error = _writer_q.get()
+        try:
+            with open(path, 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            logger.error(f"后台写入文件失败 {path}: {str(e)}")
+            if on_error:
+                on_error(e)
+        finally:
+            _writer_q.task_done()
+
+
+threading.Thread(target=_drain_writes, name="result-writer", daemon=True).start()
+
+
+class StartThrottle:
+    """启动节流 - 保证相邻两次启动间隔不小于 1/max_per_second 秒（线程安全）"""
+
+    def __init__(self, max_per_second: float):
+        if max_per_second <= 0:
+            raise ValueError(f"每秒启动数必须大于0: {max_per_second}")
+        self.interval = 1.0 / max_per_second
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """占用下一个启动时间片，并等待到该时间点"""
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start)
+            self._next_start = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+def file_sha256(file_path: str) -> str:
+    """计算文件内容的SHA-256哈希"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """识别结果缓存 - 按图片内容哈希（SHA-256，仅字节完全相同才命中）缓存识别结果，LRU淘汰并支持过期时间"""
+
+    def __init__(self, cache_file: str, max_size: int = DETECT_CACHE_MAX_SIZE, ttl: int = DETECT_CACHE_TTL):
+        self.cache_file = cache_file
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (缓存时间戳, 识别结果)；跨进程持久化，因此使用墙钟时间
+        self._entries = OrderedDict()
+        # 多设备批量执行时各测试器共享同一缓存
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """从本地文件加载缓存，实现跨进程热启动"""
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'rb') as f:
+                for key, saved_at, result in orjson.loads(f.read()):
+                    self._entries[key] = (saved_at, result)
+            logger.info(f"已加载识别缓存: {len(self._entries)}条")
+        except Exception as e:
+            logger.warning(f"识别缓存加载失败，忽略: {str(e)}")
+            self._entries.clear()
+
+    def save(self):
+        """将未过期的缓存写回本地文件"""
+        try:
+            now = time.time()
+            # 持锁写盘，避免多个测试器同时保存时文件内容交错
+            with self._lock:
+                entries = [[key, saved_at, result] for key, (saved_at, result) in self._entries.items()
+                           if now - saved_at <= self.ttl]
+                with open(self.cache_file, 'wb') as f:
+                    f.write(orjson.dumps(entries))
+        except Exception as e:
+            logger.warning(f"识别缓存保存失败: {str(e)}")
+
+    def has_cache(self, key: str) -> bool:
+        """判断缓存是否存在且未过期"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                return False
+            return True
+
+    def get(self, key: str):
+        """读取缓存的识别结果，未命中返回None"""
+        with self._lock:
+            if not self.has_cache(key):
+                return None
+            self._entries.move_to_end(key)
+            return dict(self._entries[key][1])
+
+    def put(self, key: str, result: dict):
+        """写入识别结果，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = (time.time(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
 
 class CloudFileManager:
     """云端文件管理器 - 负责文件的创建和清理"""
 
-    def __init__(self, access_token, project_id):
+    def __init__(self, access_token, project_id, session: requests.Session = None):
         self.access_token = access_token
         self.project_id = project_id
+        self.session = session or create_http_session()
 
     def delete_cloud_file(self, file_id: str) -> bool:
         """
@@ -54,7 +318,7 @@ class CloudFileManager:
         Returns:
             删除是否成功
         """
-        print(f"尝试删除云端文件: {file_id}")
+        logger.debug(f"尝试删除云端文件: {file_id}")
         try:
             # 准备删除请求参数
             params = {
@@ -63,18 +327,13 @@ class CloudFileManager:
                 "projectId": self.project_id
             }
 
-            headers = {
-                "User-Agent": "SafetyHelmetMonitor/1.0"
-            }
-
             # 发送DELETE请求
-            response = requests.delete(DELETE_FILE_URL, params=params, headers=headers, timeout=10)
+            response = self.session.delete(DELETE_FILE_URL, params=params, timeout=DELETE_TIMEOUT)
 
-            print(f"删除文件响应状态码: {response.status_code}")
-            print(f"删除文件响应内容: {response.text}")
+            logger.debug(f"删除文件响应: {response.status_code} {response.text}")
 
             if response.status_code == 200:
-                result = response.json()
+                result = orjson.loads(response.content)
                 meta = result.get("meta", {})
 
                 if meta.get("code") == 200:
@@ -97,9 +356,35 @@ class CloudFileManager:
 class VoiceAlert:
     """语音告警类 - 支持直接使用本地语音文件下发"""
 
-    def __init__(self, access_token, device_serial):
+    def __init__(self, access_token, device_serial, session: requests.Session = None,
+                 channel_no: int = 1, voice_file_path: str = None):
         self.access_token = access_token
         self.device_serial = device_serial
+        self.session = session or create_http_session()
+        self.channel_no = channel_no
+        self.voice_file_path = voice_file_path
+        # 预编码的multipart请求体缓存: (文件路径, 修改时间, 通道号) -> (Content-Type, 请求体)
+        self._voice_body_cache = {}
+
+    def _build_voice_body(self, voice_file_path: str, channel_no: int):
+        """构建语音下发的multipart请求体，语音文件未变化时直接复用"""
+        cache_key = (voice_file_path, os.path.getmtime(voice_file_path), channel_no)
+        cached = self._voice_body_cache.get(cache_key)
+        if cached:
+            return cached
+
+        with open(voice_file_path, 'rb') as f:
+            voice_bytes = f.read()
+
+        fields = [
+            ("accessToken", self.access_token),
+            ("deviceSerial", self.device_serial),
+            ("channelNo", str(channel_no)),
+            ("voiceFile", (os.path.basename(voice_file_path), voice_bytes, 'audio/mpeg')),
+        ]
+        body, content_type = encode_multipart_formdata(fields)
+        self._voice_body_cache = {cache_key: (content_type, body)}
+        return content_type, body
 
     def send_voice_alert_from_local(self, voice_file_path: str, channel_no: int = 1) -> dict:
         """直接使用本地语音文件发送语音告警"""
@@ -111,72 +396,60 @@ class VoiceAlert:
         if not voice_file_path.lower().endswith(('.mp3', '.mpeg')):
             return {"error": "语音文件格式不支持，仅支持MP3", "code": "10002"}
 
-        file_handle = None
         try:
-            # 打开本地文件
-            file_handle = open(voice_file_path, 'rb')
-            files = {
-                'voiceFile': (os.path.basename(voice_file_path), file_handle, 'audio/mpeg')
-            }
-
-            data = {
-                "accessToken": self.access_token,
-                "deviceSerial": self.device_serial,
-                "channelNo": channel_no
-            }
+            content_type, body = self._build_voice_body(voice_file_path, channel_no)
 
             logger.info(f"从本地发送语音告警: 设备{self.device_serial}, 文件{voice_file_path}")
-            response = requests.post(VOICE_SENDONCE_URL, files=files, data=data, timeout=15)
+            response = self.session.post(VOICE_SENDONCE_URL, data=body,
+                                         headers={"Content-Type": content_type}, timeout=VOICE_TIMEOUT)
             response.raise_for_status()
 
-            result = response.json()
+            result = orjson.loads(response.content)
             logger.info(f"本地语音下发响应: {result}")
             return result
 
-        except requests.exceptions.Timeout:
-            return {"error": "语音下发请求超时", "code": "20008"}
+        except requests.exceptions.ReadTimeout:
+            # 本地读超时时服务端可能已处理并播报，使用独立错误码且不重试，避免重复播报；
+            # 只有服务端在响应中返回的 20008 才会由 play_alert_voice 重试
+            return {"error": "语音下发请求超时", "code": "49998"}
+        except requests.exceptions.ConnectionError as e:
+            # 连接失败已由传输层重试，不再叠加应用层重试
+            return {"error": f"语音下发连接失败: {str(e)}", "code": "49999"}
         except Exception as e:
             return {"error": f"语音下发异常: {str(e)}", "code": "49999"}
-        finally:
-            # 确保文件被关闭
-            if file_handle:
-                file_handle.close()
 
     def play_alert_voice(self, local_file_path: str = None):
         """播放告警语音 - 支持直接使用本地文件路径"""
         try:
             # 优先使用传入的本地路径，其次使用配置的本地路径
-            voice_path = local_file_path or VOICE_FILE_PATH
+            voice_path = local_file_path or self.voice_file_path
             if not voice_path:
                 logger.error("语音文件路径未配置")
                 return False
 
             logger.info(f"准备播放本地语音告警: 设备{self.device_serial}, 文件{voice_path}")
 
-            # 直接使用本地文件发送
-            result = self.send_voice_alert_from_local(voice_path, CHANNEL_NO)
+            # 直接使用本地文件发送，设备响应超时等暂时性错误按指数退避重试
+            for attempt in range(VOICE_MAX_RETRIES + 1):
+                result = self.send_voice_alert_from_local(voice_path, self.channel_no)
+                code = result.get("code")
+                if code not in VOICE_RETRYABLE_CODES or attempt == VOICE_MAX_RETRIES:
+                    break
+
+                delay = VOICE_RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random() * VOICE_RETRY_JITTER)
+                delay = min(delay, VOICE_RETRY_MAX_DELAY)
+                logger.warning(f"语音下发暂时失败 (code={code})，{delay:.1f}秒后进行第{attempt + 1}次重试")
+                time.sleep(delay)
 
             if "error" in result:
                 logger.error(f"语音播报失败: {result['error']}")
                 return False
 
-            code = result.get("code")
             if code == "200":
                 logger.info("本地语音播报成功")
                 return True
             else:
-                error_mapping = {
-                    "10001": "参数不合法",
-                    "20002": "设备不存在",
-                    "10031": "权限不足",
-                    "20018": "用户不拥有该设备",
-                    "20007": "设备不在线",
-                    "20008": "设备响应超时",
-                    "20001": "通道不存在",
-                    "20015": "设备不支持对讲",
-                    "111000": "资源包余量不足",
-                }
-                error_msg = error_mapping.get(code, f"未知错误码: {code}")
+                error_msg = VOICE_ERROR_MAP.get(code, f"未知错误码: {code}")
                 logger.error(f"语音播报失败: {error_msg}")
                 return False
 
@@ -188,30 +461,37 @@ class VoiceAlert:
 class RealProcessTester:
     """真实流程测试器 - 集成云端图片清理功能"""
 
-    def __init__(self):
-        print(" 初始化真实流程测试器...")
-
-        # 验证必要配置
-        if not all([YS_ACCESS_TOKEN, DEVICE_SERIAL, PROJECT_ID]):
-            missing = []
-            if not YS_ACCESS_TOKEN: missing.append("YS_ACCESS_TOKEN")
-            if not DEVICE_SERIAL: missing.append("DEVICE_SERIAL")
-            if not PROJECT_ID: missing.append("CAPTURE_PROJECT_ID")
-            raise ValueError(f" 缺少必要配置: {', '.join(missing)}")
+    def __init__(self, config: Config = None, session: requests.Session = None,
+                 detect_cache: DetectionCache = None, device_tag: str = ""):
+        # 未传入配置时从环境变量读取（缺少必要配置时抛出 ValueError）
+        self.config = config or Config.from_env()
+        # 多设备批量执行时用于区分云端文件ID和本地存储目录
+        self.device_tag = device_tag
 
         # 存储配置
-        self.storage_base_path = os.getenv("STORAGE_BASE_PATH", "./real_capture_images")
-        if not os.path.exists(self.storage_base_path):
-            os.makedirs(self.storage_base_path)
+        self.storage_base_path = os.path.join(os.getenv("STORAGE_BASE_PATH", "./real_capture_images"), device_tag)
+        os.makedirs(self.storage_base_path, exist_ok=True)
+        # 当日存储目录缓存，跨天时才重新计算并创建
+        self._today_date = None
+        self._today_folder = None
 
         # 告警配置
         self.alert_threshold = int(os.getenv("ALERT_THRESHOLD", "1"))
 
-        # 初始化服务模块
-        self.voice_alert = VoiceAlert(YS_ACCESS_TOKEN, DEVICE_SERIAL)
-        self.cloud_manager = CloudFileManager(YS_ACCESS_TOKEN, PROJECT_ID)
-
-        # 测试结果记录
+        # 初始化服务模块（共享同一个HTTP会话，批量执行时由调用方传入）
+        self.session = session or create_http_session()
+        self.session.headers["accessToken"] = self.config.access_token
+        self.voice_alert = VoiceAlert(self.config.access_token, self.config.device_serial, self.session,
+                                      self.config.channel_no, self.config.voice_path)
+        self.cloud_manager = CloudFileManager(self.config.access_token, self.config.project_id, self.session)
+        # 外部传入的共享缓存由调用方负责保存（批量执行时所有设备结束后保存一次）
+        self._owns_detect_cache = detect_cache is None
+        if detect_cache is None and ENABLE_DETECT_CACHE:
+            detect_cache = DetectionCache(DETECT_CACHE_FILE)
+        self.detect_cache = detect_cache
+
+        # 测试结果记录（识别后的步骤在线程池中并行执行，写入时加锁）
+        self._results_lock = threading.Lock()
         self.test_results = {
             "start_time": datetime.now(),
             "steps": [],
@@ -223,93 +503,88 @@ class RealProcessTester:
             "cloud_file_cleaned": False
         }
 
-        print(f"配置信息:")
-        print(f"   设备序列号: {DEVICE_SERIAL}")
-        print(f"   通道号: {CHANNEL_NO}")
-        print(f"   项目ID: {PROJECT_ID}")
-        print(f"   云端清理: {'启用' if ENABLE_CLOUD_CLEANUP else '禁用'}")
+        with _print_lock:
+            print(" 初始化真实流程测试器...")
+            print(f"配置信息:")
+            print(f"   设备序列号: {self.config.device_serial}")
+            print(f"   通道号: {self.config.channel_no}")
+            print(f"   项目ID: {self.config.project_id}")
+            print(f"   云端清理: {'启用' if self.config.cleanup_enabled else '禁用'}")
 
-    def log_step(self, step_name: str, success: bool, details: str = ""):
-        """记录测试步骤"""
+    def log_step(self, step_name: str, success: bool, details: str = "", ts: datetime = None):
+        """记录测试步骤（ts 为调用方已获取的当前时间，避免重复取时）"""
         step_record = {
             "name": step_name,
             "success": success,
             "details": details,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": (ts or datetime.now()).isoformat(timespec='seconds')
         }
-        self.test_results["steps"].append(step_record)
+        with self._results_lock:
+            self.test_results["steps"].append(step_record)
 
-        status = "ture" if success else "false"
-        print(f"{status} {step_name}: {details}")
+        if success:
+            logger.info(f"{step_name}: {details}")
+        else:
+            logger.warning(f"{step_name}失败: {details}")
 
     def cloud_capture_sync(self):
         """同步云抓拍"""
-        print("\n1. 执行同步云抓拍...")
+        logger.debug("1. 执行同步云抓拍...")
+        # 本步骤只取一次当前时间，文件ID、步骤记录和抓拍时间（决定本地文件名）保持一致
+        t_now = datetime.now()
         try:
-            file_id = f"capture_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            file_prefix = f"capture_{self.device_tag}_" if self.device_tag else "capture_"
+            file_id = f"{file_prefix}{t_now.strftime('%Y%m%d_%H%M%S')}"
 
             data = {
-                "accessToken": YS_ACCESS_TOKEN,
-                "channelNo": str(CHANNEL_NO),
-                "deviceSerial": DEVICE_SERIAL,
+                "accessToken": self.config.access_token,
+                "channelNo": str(self.config.channel_no),
+                "deviceSerial": self.config.device_serial,
                 "fileId": file_id,
-                "projectId": PROJECT_ID,
+                "projectId": self.config.project_id,
                 "captureType": "1"
             }
 
-            headers = {
-                "accessToken": YS_ACCESS_TOKEN,
-                "Content-Type": "application/x-www-form-urlencoded"
-            }
-
-            response = requests.post(CAPTURE_URL, data=data, headers=headers, timeout=30)
-            print(f" 抓拍响应: {response.status_code}")
+            response = self.session.post(CAPTURE_URL, data=data, timeout=CAPTURE_TIMEOUT)
+            logger.debug(f"抓拍响应: {response.status_code}")
 
-            result = response.json()
+            result = orjson.loads(response.content)
             meta = result.get("meta", {})
 
             if meta.get("code") == 200:
                 image_url = result.get("data", "")
 
                 if image_url and image_url.startswith("http"):
-                    self.log_step("同步云抓拍", True, f"抓拍成功")
+                    self.log_step("同步云抓拍", True, f"抓拍成功", ts=t_now)
                     return {
                         "success": True,
                         "image_url": image_url,
                         "file_id": file_id,
-                        "timestamp": datetime.now(),
-                        "device_serial": DEVICE_SERIAL,
-                        "channel_no": CHANNEL_NO
+                        "timestamp": t_now,
+                        "device_serial": self.config.device_serial,
+                        "channel_no": self.config.channel_no
                     }
                 else:
-                    self.log_step("同步云抓拍", False, f"图片URL无效")
+                    self.log_step("同步云抓拍", False, f"图片URL无效", ts=t_now)
                     return None
             else:
                 error_msg = meta.get("message", "未知错误")
-                self.log_step("同步云抓拍", False, f"API错误: {error_msg}")
+                self.log_step("同步云抓拍", False, f"API错误: {error_msg}", ts=t_now)
                 return None
 
         except Exception as e:
-            self.log_step("同步云抓拍", False, f"异常: {str(e)}")
+            self.log_step("同步云抓拍", False, f"异常: {str(e)}", ts=t_now)
             return None
 
     def ai_helmet_detection(self, image_url: str):
         """AI安全帽识别"""
-        print("\n2. 执行AI安全帽识别...")
+        logger.debug("2. 执行AI安全帽识别...")
         try:
-            headers = {
-                "accessToken": YS_ACCESS_TOKEN,
-                "Content-Type": "application/json"
-            }
+            request_body = DETECT_BODY_TEMPLATE.replace(DETECT_URL_PLACEHOLDER, orjson.dumps(image_url))
 
-            request_body = {
-                "stream": False,
-                "dataInfo": [{"data": image_url, "type": "url", "modal": "image"}],
-                "dataParams": [{"modal": "image", "img_width": 1280, "img_height": 720}]
-            }
-
-            response = requests.post(HELMET_DETECT_URL, headers=headers, json=request_body, timeout=20)
-            result = response.json()
+            response = self.session.post(HELMET_DETECT_URL, headers=JSON_HEADERS, data=request_body,
+                                         timeout=DETECT_TIMEOUT)
+            result = orjson.loads(response.content)
             meta = result.get("meta", {})
 
             if meta.get("code") != 200:
@@ -330,15 +605,12 @@ class RealProcessTester:
             content_ann = images[0].get("contentAnn", {})
             bboxes = content_ann.get("bboxes", [])
             person_count = len(bboxes)
-            unworn_count = 0
-
-            for bbox in bboxes:
-                tag_info = bbox.get("tagInfo", {})
-                labels = tag_info.get("labels", [])
-                for label in labels:
-                    if label.get("key") == "category" and label.get("label") == "no":
-                        unworn_count += 1
-                        break
+            # 任一 category 标签为 no 即视为未佩戴
+            unworn_count = sum(
+                1 for bbox in bboxes
+                if any(label.get("key") == "category" and label.get("label") == "no"
+                       for label in bbox.get("tagInfo", {}).get("labels", ()))
+            )
 
             worn_count = person_count - unworn_count
             is_alert = unworn_count > 0
@@ -356,40 +628,110 @@ class RealProcessTester:
             self.log_step("AI安全帽识别", False, f"异常: {str(e)}")
             return None
 
-    def download_and_save_image(self, image_url: str, capture_result: dict, detection_result: dict):
-        """下载图片并保存识别结果"""
-        print("\n3. 下载图片并保存结果...")
+    def detect_with_cache(self, capture_result: dict):
+        """
+        带缓存的AI识别 - 先下载图片计算内容哈希，命中缓存则跳过识别接口
+        Returns:
+            (识别结果, 预下载的本地图片路径)，预下载失败时路径为 None
+        """
+        image_url = capture_result["image_url"]
         try:
-            date_folder = datetime.now().strftime("%Y-%m-%d")
-            date_folder_path = os.path.join(self.storage_base_path, date_folder)
-            if not os.path.exists(date_folder_path):
-                os.makedirs(date_folder_path)
+            file_path, _ = self.get_storage_paths(capture_result)
+            self.download_image(image_url, file_path)
+            cache_key = file_sha256(file_path)
+        except Exception as e:
+            logger.warning(f"预下载图片失败，跳过识别缓存: {str(e)}")
+            return self.ai_helmet_detection(image_url), None
 
-            filename = f"capture_{capture_result['timestamp'].strftime('%H%M%S')}.jpg"
-            file_path = os.path.join(date_folder_path, filename)
+        cached_result = self.detect_cache.get(cache_key)
+        if cached_result is not None:
+            self.log_step("AI安全帽识别", True, f"命中识别缓存: {cached_result.get('person_count', 0)}人, "
+                                                f"未佩戴: {cached_result.get('unworn_count', 0)}人")
+            return cached_result, file_path
 
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
+        detection_result = self.ai_helmet_detection(image_url)
+        if detection_result:
+            self.detect_cache.put(cache_key, detection_result)
+        return detection_result, file_path
+
+    def get_storage_paths(self, capture_result: dict):
+        """生成按日期归档的图片和结果文件路径"""
+        today = date.today()
+        if today != self._today_date:
+            self._today_folder = os.path.join(self.storage_base_path, today.strftime("%Y-%m-%d"))
+            os.makedirs(self._today_folder, exist_ok=True)
+            self._today_date = today
+        date_folder_path = self._today_folder
+
+        capture_time = capture_result['timestamp'].strftime('%H%M%S')
+        file_path = os.path.join(date_folder_path, f"capture_{capture_time}.jpg")
+        result_path = os.path.join(date_folder_path, f"result_{capture_time}.json")
+        return file_path, result_path
+
+    def download_image(self, image_url: str, file_path: str):
+        """流式下载图片，边接收边写盘，避免整张图片缓存在内存中"""
+        # 先写入临时文件，下载完整后再重命名，中途失败不留下残缺图片
+        part_path = f"{file_path}.part"
+        try:
+            # 图片地址可能不在开放平台域名下，下载时不携带 accessToken 请求头
+            with self.session.get(image_url, headers={"accessToken": None}, stream=True,
+                                  timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                with open(part_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
+            os.replace(part_path, file_path)
+        except Exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+    def _save_then_cleanup(self, capture_result: dict, detection_result: dict, local_image_path: str = None):
+        """先下载保存图片（或按配置跳过），再清理云端文件，避免清理先于下载删除图片"""
+        is_alert_image = detection_result.get("is_alert", False) or detection_result.get("unworn_count", 0) > 0
+        if is_alert_image or not SAVE_ALERT_ONLY:
+            self.download_and_save_image(capture_result["image_url"], capture_result, detection_result,
+                                         local_image_path)
+        else:
+            self.discard_local_image(local_image_path)
+        self.cleanup_cloud_file(capture_result["file_id"], detection_result)
 
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
+    def discard_local_image(self, image_path: str = None):
+        """非告警图片不在本地保存，删除识别缓存预下载的图片"""
+        try:
+            if image_path and os.path.exists(image_path):
+                os.remove(image_path)
+            self.log_step("下载保存", True, "非告警图片，跳过本地保存")
+        except Exception as e:
+            self.log_step("下载保存", False, f"异常: {str(e)}")
+
+    def download_and_save_image(self, image_url: str, capture_result: dict, detection_result: dict,
+                                local_image_path: str = None):
+        """下载图片并保存识别结果（local_image_path 为识别缓存已预下载的图片）"""
+        logger.debug("3. 下载图片并保存结果...")
+        try:
+            file_path, result_path = self.get_storage_paths(capture_result)
 
-            result_filename = f"result_{capture_result['timestamp'].strftime('%H%M%S')}.json"
-            result_path = os.path.join(date_folder_path, result_filename)
+            # 启用识别缓存时图片已在识别前下载
+            if local_image_path != file_path:
+                self.download_image(image_url, file_path)
 
             result_data = {
-                "capture_info": {**capture_result, "timestamp": capture_result["timestamp"].isoformat()},
+                "capture_info": capture_result,
                 "detection_result": detection_result,
                 "storage_info": {
                     "image_path": file_path, "result_path": result_path,
-                    "saved_time": datetime.now().isoformat()
+                    "saved_time": datetime.now()
                 }
             }
 
-            with open(result_path, 'w', encoding='utf-8') as f:
-                json.dump(result_data, f, indent=2, ensure_ascii=False)
+            # 交给后台线程写盘，不阻塞主流程
+            option = orjson.OPT_INDENT_2 if RESULT_JSON_PRETTY else 0
+            # 写入失败时记录为失败步骤，finalize_test 等待写盘完成后据此判定整体结果
+            _writer_q.put((result_path, orjson.dumps(result_data, option=option),
+                           lambda e: self.log_step("结果写入", False, f"异常: {str(e)}")))
 
-            self.log_step("下载保存", True, "图片和结果保存成功")
+            self.log_step("下载保存", True, "图片保存成功，识别结果已提交后台写入")
             return file_path, result_path
 
         except Exception as e:
@@ -398,7 +740,7 @@ class RealProcessTester:
 
     def check_alert_condition(self, detection_result: dict):
         """检查告警条件"""
-        print("\n4. 检查告警条件...")
+        logger.debug("4. 检查告警条件...")
         try:
             unworn_count = detection_result.get("unworn_count", 0)
             should_alert = unworn_count >= self.alert_threshold
@@ -410,14 +752,14 @@ class RealProcessTester:
 
     def play_voice_alert(self):
         """播放语音告警 - 使用本地文件"""
-        print("\n5. 播放语音告警...")
+        logger.debug("5. 播放语音告警...")
         try:
-            if not VOICE_FILE_PATH:
+            if not self.config.voice_path:
                 self.log_step("语音告警", False, "语音文件路径未配置")
                 return False
 
             # 直接使用本地文件路径
-            voice_success = self.voice_alert.play_alert_voice(VOICE_FILE_PATH)
+            voice_success = self.voice_alert.play_alert_voice(self.config.voice_path)
 
             if voice_success:
                 self.log_step("语音告警", True, "告警播报成功")
@@ -432,9 +774,9 @@ class RealProcessTester:
 
     def cleanup_cloud_file(self, file_id: str, detection_result: dict):
         """清理云端文件 - 如果不是告警图片则删除"""
-        print("\n6. 检查云端文件清理...")
+        logger.debug("6. 检查云端文件清理...")
 
-        if not ENABLE_CLOUD_CLEANUP:
+        if not self.config.cleanup_enabled:
             self.log_step("云端清理", True, "功能已禁用，跳过清理")
             return False
 
@@ -465,13 +807,14 @@ class RealProcessTester:
 
     def run_real_process_test(self):
         """运行真实流程测试"""
-        print("=" * 60)
-        print(" 开始真实流程测试")
-        print("=" * 60)
-        print(f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"设备: {DEVICE_SERIAL}, 通道: {CHANNEL_NO}")
-        print(f"告警阈值: {self.alert_threshold}人, 云端清理: {'启用' if ENABLE_CLOUD_CLEANUP else '禁用'}")
-        print("=" * 60)
+        with _print_lock:
+            print("=" * 60)
+            print(" 开始真实流程测试")
+            print("=" * 60)
+            print(f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            print(f"设备: {self.config.device_serial}, 通道: {self.config.channel_no}")
+            print(f"告警阈值: {self.alert_threshold}人, 云端清理: {'启用' if self.config.cleanup_enabled else '禁用'}")
+            print("=" * 60)
 
         try:
             # 步骤1: 同步云抓拍
@@ -480,24 +823,37 @@ class RealProcessTester:
                 self.finalize_test(False)
                 return self.test_results
 
-            # 步骤2: AI安全帽识别
-            detection_result = self.ai_helmet_detection(capture_result["image_url"])
+            # 步骤2: AI安全帽识别（启用缓存时相同图片跳过识别）
+            local_image_path = None
+            if self.detect_cache:
+                detection_result, local_image_path = self.detect_with_cache(capture_result)
+            else:
+                detection_result = self.ai_helmet_detection(capture_result["image_url"])
             if not detection_result:
+                # 识别失败时删除识别缓存预下载的图片，避免残留在存储目录
+                if local_image_path and os.path.exists(local_image_path):
+                    try:
+                        os.remove(local_image_path)
+                    except OSError as e:
+                        logger.warning(f"删除预下载图片失败: {str(e)}")
                 self.finalize_test(False)
                 return self.test_results
 
-            # 步骤3: 下载图片并保存结果
-            self.download_and_save_image(capture_result["image_url"], capture_result, detection_result)
-
-            # 步骤4: 检查告警并播放语音
+            # 步骤3: 检查告警条件（识别结果确定后，后续步骤相互独立）
             should_alert = self.check_alert_condition(detection_result)
-            if should_alert:
-                self.play_voice_alert()
-            else:
-                self.log_step("语音告警", True, "无需告警，跳过播报")
 
-            # 步骤5: 云端文件清理（如果不是告警图片）
-            self.cleanup_cloud_file(capture_result["file_id"], detection_result)
+            # 步骤4: 语音告警与"下载保存→云端清理"并行执行（均为网络I/O等待）
+            # 云端清理会删除下载所用的图片，因此二者必须在同一任务中先后执行
+            with ThreadPoolExecutor(max_workers=POST_DETECTION_WORKERS) as executor:
+                tasks = [executor.submit(self._save_then_cleanup, capture_result, detection_result,
+                                         local_image_path)]
+                if should_alert:
+                    tasks.append(executor.submit(self.play_voice_alert))
+                else:
+                    self.log_step("语音告警", True, "无需告警，跳过播报")
+
+                for task in tasks:
+                    task.result()
 
             # 总结测试结果
             self.finalize_test(True, detection_result, should_alert)
@@ -510,6 +866,10 @@ class RealProcessTester:
 
     def finalize_test(self, success: bool, detection_result: dict = None, alert_triggered: bool = False):
         """最终化测试结果"""
+        # 等待后台写盘完成，并刷新缓冲的文件日志
+        _writer_q.join()
+        _log_buffer_handler.flush()
+
         self.test_results["success"] = success and all(step["success"] for step in self.test_results["steps"])
         self.test_results["end_time"] = datetime.now()
         self.test_results["duration"] = (
@@ -519,68 +879,152 @@ class RealProcessTester:
             self.test_results["detection_result"] = detection_result
             self.test_results["alert_triggered"] = alert_triggered
 
+        if self.detect_cache and self._owns_detect_cache:
+            self.detect_cache.save()
+
         self.print_test_summary()
 
     def print_test_summary(self):
         """打印测试总结"""
-        print("\n" + "=" * 60)
-        print(" 真实流程测试总结")
-        print("=" * 60)
-
-        total_steps = len(self.test_results["steps"])
-        successful_steps = sum(1 for step in self.test_results["steps"] if step["success"])
-
-        print(
-            f"测试时间: {self.test_results['start_time'].strftime('%H:%M:%S')} - {self.test_results['end_time'].strftime('%H:%M:%S')}")
-        print(f"总耗时: {self.test_results['duration']:.2f}秒")
-        print(f"步骤完成: {successful_steps}/{total_steps}")
-        print(f"整体结果: {'成功' if self.test_results['success'] else '失败'}")
-
-        if 'detection_result' in self.test_results:
-            dr = self.test_results['detection_result']
-            print(f"\n识别结果:")
-            print(f"  总人数: {dr.get('person_count', 0)}")
-            print(f"  未佩戴: {dr.get('unworn_count', 0)}")
-            print(f"  结论: {dr.get('conclusion', '未知')}")
-            print(f"  告警触发: {'是' if self.test_results['alert_triggered'] else '否'}")
-            print(f"  云端清理: {'是' if self.test_results.get('cloud_file_cleaned') else '否'}")
-
-        if self.test_results["success"]:
-            print("\n 测试通过！系统功能正常。")
-        else:
-            print("\n 失败的步骤:")
-            for step in self.test_results["steps"]:
-                if not step["success"]:
-                    print(f"  - {step['name']}: {step['details']}")
+        with _print_lock:
+            print("\n" + "=" * 60)
+            print(" 真实流程测试总结")
+            print("=" * 60)
+            print(f"设备: {self.config.device_serial}, 通道: {self.config.channel_no}")
+
+            total_steps = len(self.test_results["steps"])
+            successful_steps = sum(1 for step in self.test_results["steps"] if step["success"])
+
+            print(
+                f"测试时间: {self.test_results['start_time'].strftime('%H:%M:%S')} - {self.test_results['end_time'].strftime('%H:%M:%S')}")
+            print(f"总耗时: {self.test_results['duration']:.2f}秒")
+            print(f"步骤完成: {successful_steps}/{total_steps}")
+            print(f"整体结果: {'成功' if self.test_results['success'] else '失败'}")
+
+            if 'detection_result' in self.test_results:
+                dr = self.test_results['detection_result']
+                print(f"\n识别结果:")
+                print(f"  总人数: {dr.get('person_count', 0)}")
+                print(f"  未佩戴: {dr.get('unworn_count', 0)}")
+                print(f"  结论: {dr.get('conclusion', '未知')}")
+                print(f"  告警触发: {'是' if self.test_results['alert_triggered'] else '否'}")
+                print(f"  云端清理: {'是' if self.test_results.get('cloud_file_cleaned') else '否'}")
+
+            if self.test_results["success"]:
+                print("\n 测试通过！系统功能正常。")
+            else:
+                print("\n 失败的步骤:")
+                for step in self.test_results["steps"]:
+                    if not step["success"]:
+                        print(f"  - {step['name']}: {step['details']}")
+
+            print("=" * 60)
+
+
+def parse_device_channels(value: str, default_channel: int = 1):
+    """解析 "序列号:通道号,序列号" 格式的设备列表，省略通道号时使用默认通道"""
+    device_channels = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        device_serial, _, channel_no = item.partition(":")
+        device_channels.append((device_serial.strip(), int(channel_no) if channel_no else default_channel))
+    return device_channels
+
+
+def run_batch(config: Config, device_channels: list, max_concurrent: int = BATCH_MAX_CONCURRENT,
+              max_per_second: float = BATCH_MAX_PER_SECOND):
+    """
+    多设备批量执行流程测试
+    Args:
+        config: 基础配置，设备序列号和通道号按设备替换
+        device_channels: (设备序列号, 通道号) 列表
+        max_concurrent: 同时执行的设备数上限
+        max_per_second: 每秒启动的设备数上限，避免超出接口限流
+    Returns:
+        (设备标识, 测试结果) 列表，顺序与 device_channels 一致
+    """
+    # 参数非法时抛出 ValueError
+    throttle = StartThrottle(max_per_second)
+    # 所有设备共享一个连接池，容量覆盖每台设备识别后的并行请求
+    session = create_http_session(pool_maxsize=max_concurrent * POST_DETECTION_WORKERS)
+    detect_cache = DetectionCache(DETECT_CACHE_FILE) if ENABLE_DETECT_CACHE else None
+
+    def run_device(device_serial: str, channel_no: int, device_tag: str):
+        # 在工作线程内节流，排队的设备在线程空闲时也按速率启动
+        throttle.wait()
+        start_time = datetime.now()
+        try:
+            tester = RealProcessTester(replace(config, device_serial=device_serial, channel_no=channel_no),
+                                       session, detect_cache, device_tag)
+            return tester.run_real_process_test()
+        except Exception as e:
+            # 单台设备异常不影响其他设备，记录为失败结果
+            logger.error(f"设备 {device_tag} 测试异常: {str(e)}")
+            end_time = datetime.now()
+            return {
+                "start_time": start_time,
+                "steps": [{
+                    "name": "设备测试",
+                    "success": False,
+                    "details": f"异常: {str(e)}",
+                    "timestamp": end_time.isoformat(timespec='seconds')
+                }],
+                "success": False,
+                "end_time": end_time,
+                "duration": (end_time - start_time).total_seconds(),
+                "detection_result": {},
+                "alert_triggered": False,
+                "cloud_file_cleaned": False
+            }
+
+    tasks = []
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        for device_serial, channel_no in device_channels:
+            device_tag = f"{device_serial}_{channel_no}"
+            tasks.append((device_tag, executor.submit(run_device, device_serial, channel_no, device_tag)))
+
+        results = [(device_tag, task.result()) for device_tag, task in tasks]
+
+    # 共享缓存在所有设备结束后统一保存一次
+    if detect_cache:
+        detect_cache.save()
+    return results
 
-        print("=" * 60)
+
+def save_test_results(results: dict, device_tag: str = ""):
+    """保存测试结果到JSON文件"""
+    tag = f"{device_tag}_" if device_tag else ""
+    results_file = f"test_results_{tag}{results['start_time'].strftime('%Y%m%d_%H%M%S')}.json"
+    with open(results_file, 'wb') as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+
+    print(f"\n 结果已保存: {results_file}")
 
 
 def main():
     """主函数"""
     try:
-        # 检查必要配置
-        required_env_vars = ["YS_ACCESS_TOKEN", "DEVICE_SERIAL", "CAPTURE_PROJECT_ID"]
-        missing_vars = [var for var in required_env_vars if not os.getenv(var)]
-
-        if missing_vars:
-            print(f" 缺少配置: {', '.join(missing_vars)}")
+        # 读取并检查必要配置
+        try:
+            config = Config.from_env()
+        except ValueError as e:
+            print(f" {str(e)}")
             return
 
-        # 运行测试
-        tester = RealProcessTester()
-        results = tester.run_real_process_test()
+        # 运行测试：配置了 DEVICE_CHANNELS 时多设备并发执行
+        device_channels = parse_device_channels(DEVICE_CHANNELS, config.channel_no)
+        if device_channels:
+            batch_results = run_batch(config, device_channels)
+        else:
+            tester = RealProcessTester(config)
+            batch_results = [("", tester.run_real_process_test())]
 
         # 保存结果
-        if results["end_time"]:
-            results_file = f"test_results_{results['start_time'].strftime('%Y%m%d_%H%M%S')}.json"
-            with open(results_file, 'w', encoding='utf-8') as f:
-                serializable_results = results.copy()
-                serializable_results["start_time"] = serializable_results["start_time"].isoformat()
-                serializable_results["end_time"] = serializable_results["end_time"].isoformat()
-                json.dump(serializable_results, f, indent=2, ensure_ascii=False)
-
-            print(f"\n 结果已保存: {results_file}")
+        for device_tag, results in batch_results:
+            if results["end_time"]:
+                save_test_results(results, device_tag)
 
     except Exception as e:
         print(f" 测试失败: {str(e)}")